@@ -7,3 +7,5 @@ Use help(quora.quora) or help(quora.user) for more help.
 
 from user import User, Activity, unscroll_page
 from quora import Quora, try_cast_int
+from work_queue import WorkQueue, Worker
+from session import ScrapeSession, get_session, set_session, close_session
@@ -0,0 +1,108 @@
+#coding=utf-8
+
+####################################################################
+# Helpers
+####################################################################
+
+def class_matches(node, value):
+    """ (node, str) -> bool
+    Mirrors BeautifulSoup's class matching: value may be any single class of
+    the node, or its full class attribute.
+    ('AnswerHeader ContentHeader') matches class="AnswerHeader ContentHeader"
+    ('count') matches class="count big"
+    """
+    classes = node.get('class')
+    if classes is None:
+        return False
+    if isinstance(classes, basestring):
+        classes = classes.split()
+    return value in classes or ' '.join(classes) == value
+
+def is_inside(node, ancestor):
+    for parent in node.parents:
+        if parent is ancestor:
+            return True
+    return False
+
+####################################################################
+# API
+####################################################################
+class SelectorPlan:
+    """
+    Declarative extraction spec compiled once and run over a parse tree in a
+    single pass, instead of one soup.find / find_all walk per field.
+
+    The spec maps field names to dicts with the keys:
+        tag    - tag name to match, or None for any tag
+        class  - class to match as in soup.find(attrs={'class': ...}), or None
+        all    - collect every match (like find_all) instead of the first one
+        within - name of another (single) field; only matches inside that
+                 field's node count. If it was not found the field is None.
+
+    select() only relies on node.name, node.get('class'), node.parents and
+    root.descendants, so it works with any BeautifulSoup tree builder.
+    """
+
+    def __init__(self, spec):
+        self.fields = {}
+        self.by_tag = {}
+        self.any_tag = []
+        for field, options in spec.items():
+            rule = (field, options.get('class'), bool(options.get('all')), options.get('within'))
+            self.fields[field] = rule
+            if options.get('tag') is None:
+                self.any_tag.append(rule)
+            else:
+                self.by_tag.setdefault(options['tag'], []).append(rule)
+
+        for field, value, many, within in self.fields.values():
+            if within is None:
+                continue
+            if within not in self.fields:
+                raise ValueError('Field %s is within unknown field %s' % (field, within))
+            if self.fields[within][2]:
+                raise ValueError('Field %s is within %s, which collects all matches' % (field, within))
+        for field in self.fields:
+            seen = set()
+            while field is not None:
+                if field in seen:
+                    raise ValueError('Fields %s are nested in a cycle' % ', '.join(sorted(seen)))
+                seen.add(field)
+                field = self.fields[field][3]
+
+        self.singles = sum(1 for rule in self.fields.values() if not rule[2])
+        self.has_many = self.singles < len(self.fields)
+
+    def select(self, root):
+        """ (soup) -> dict
+        Returns the first matching node (or None) for single fields and the
+        list of matching nodes for fields with all set.
+        """
+        found = {}
+        for field, value, many, within in self.fields.values():
+            found[field] = [] if many else None
+        remaining = self.singles
+
+        for node in root.descendants:
+            name = getattr(node, 'name', None)
+            if name is None:
+                continue
+            for field, value, many, within in self.by_tag.get(name, []) + self.any_tag:
+                if not many and found[field] is not None:
+                    continue
+                if value is not None and not class_matches(node, value):
+                    continue
+                if within is not None and (found[within] is None or not is_inside(node, found[within])):
+                    continue
+                if many:
+                    found[field].append(node)
+                else:
+                    found[field] = node
+                    remaining -= 1
+            if remaining == 0 and not self.has_many:
+                break
+
+        for field, value, many, within in self.fields.values():
+            if within is not None and found[within] is None:
+                found[field] = None
+        return found
@@ -1,34 +1,45 @@
 # coding=utf-8
 
-from bs4 import BeautifulSoup
+from extraction import SelectorPlan
+from session import get_session, parsed_page
 import re
-import requests
 import sys
 import traceback
 
-from pyvirtualdisplay import Display
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-
-# 0 - Xvfb (not visible)
-# 1 - Xephyr (visible)
-display = Display(visible=1, size=(800,600))
-display.start()
-
-# FIXME: Hardcoded path to Chrome profile config 
-CHROME_PROFILE_PATH = '/home/michal3141/.config/google-chrome/Default'
-options = webdriver.ChromeOptions() 
-options.add_argument("user-data-dir=%s" % CHROME_PROFILE_PATH) #Path to your chrome profile
-
-# Launching Chrome browser
-browser = None
 def get_browser():
-    global browser
-    if browser is None:
-        browser = webdriver.Chrome(chrome_options=options)
-    return browser
-
+    """ Returns the browser of the shared session, see quora.session. """
+    return get_session().browser()
+
+
+### Page layouts ###
+# Nodes gathered in a single pass by each scrape_* method, see SelectorPlan.
+ANSWER_PLAN = SelectorPlan({
+    'answer'        : {'tag': 'div',  'class': 'inline_editor_content'},
+    'question_link' : {'tag': 'a',    'class': 'question_link'},
+    'author'        : {'tag': 'a',    'class': 'user'},
+    'views'         : {'tag': 'div',  'class': 'AnswerHeader ContentHeader'},
+    'want_answers'  : {'tag': 'span', 'class': 'count'},
+    'upvote_count'  : {'tag': 'a',    'class': 'AnswerUpvotesStatsRow StatsRow'},
+    'comment_count' : {'tag': 'a',    'class': 'view_comments'},
+})
+
+QUESTION_PLAN = SelectorPlan({
+    'topic_section'     : {'tag': 'div',  'class': 'question_page_topic_section QuestionTopicsSidebar'},
+    'topics'            : {'tag': 'span', 'class': 'TopicNameSpan TopicName', 'all': True,
+                           'within': 'topic_section'},
+    'answer_count'      : {'tag': 'div',  'class': 'answer_count'},
+    'question_area'     : {'tag': 'div',  'class': 'QuestionArea'},
+    'question_title'    : {'tag': 'h1',   'within': 'question_area'},
+    'question_details'  : {'tag': 'div',  'class': 'question_details_text'},
+    'answer_wiki_area'  : {'tag': 'div',  'class': 'AnswerWikiArea'},
+    'answer_wiki'       : {'tag': 'div',  'within': 'answer_wiki_area'},
+    'related_questions' : {'tag': 'span', 'class': 'question_text', 'all': True},
+    'last_asked'        : {'tag': 'div',  'class': 'QuestionLastAskedTime'},
+})
+
+LATEST_ANSWERS_PLAN = SelectorPlan({
+    'logs' : {'tag': 'div', 'class': 'feed_item_activity', 'all': True},
+})
 
 ####################################################################
 # Helpers
@@ -55,20 +66,19 @@ def try_cast_int(s):
         return s
 
 
-def get_question_link(soup):
-    """ (soup) -> str
-    Returns the link at which the question can is present.
+def get_question_link(question_link):
+    """ (node) -> str
+    Returns the link at which the question can is present,
+    given the 'question_link' anchor selected by ANSWER_PLAN.
     """
-    question_link = soup.find('a', attrs={'class': 'question_link'})
     return 'https://www.quora.com' + question_link.get('href')
 
 
-def get_author(soup):
-    """ (soup) -> str
-    Returns the name of the author
+def get_author(author):
+    """ (node) -> str
+    Returns the name of the author, given the 'user' anchor selected by ANSWER_PLAN.
     """
-    author = soup.find('a', attrs={'class': 'user'}).contents[0]
-    return author
+    return unicode(author.contents[0])
 
 
 def extract_username(username):
@@ -91,7 +101,7 @@ def get_with_agent(url):
     user_agent = {
         'User-agent': ' Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:31.0) Gecko/20100101 Firefox/31.0',
     }
-    return requests.get(url, headers=user_agent)
+    return get_session().get(url, headers=user_agent)
 
 
 ####################################################################
@@ -105,9 +115,10 @@ class Quora:
     @staticmethod 
     def get_authors_of_questions_and_answers(question):
         from user import unscroll_page
-        get_browser().get('https://www.quora.com/%s/log' % question)
-        unscroll_page(get_browser())
-        elems = get_browser().find_elements_by_class_name('feed_item_activity')
+        browser = get_browser()
+        browser.get('https://www.quora.com/%s/log' % question)
+        unscroll_page(browser)
+        elems = browser.find_elements_by_class_name('feed_item_activity')
         answers_authors = []
         question_author = ''
         for elem in elems: 
@@ -125,13 +136,14 @@ class Quora:
         """
         if author is None:  # For short URL's
             if re.match('https', question):  # question like https://qr.ae/znrZ3
-                soup = BeautifulSoup(requests.get(question).text)
+                url = question
             else:  # question like znrZ3
-                soup = BeautifulSoup(requests.get('https://qr.ae/' + question).text)
+                url = 'https://qr.ae/' + question
         else:
             # print 'author:', author
-            soup = BeautifulSoup(requests.get('https://www.quora.com/' + question + '/answer/' + author).text)
-        return Quora.scrape_one_answer(soup)
+            url = 'https://www.quora.com/' + question + '/answer/' + author
+        with parsed_page(get_session().get(url).text) as soup:
+            return Quora.scrape_one_answer(soup)
 
     @staticmethod
     def scrape_one_answer(soup):
@@ -140,23 +152,24 @@ class Quora:
         """
         # print 'scrape_one_answer::'
         try:
-            answer = soup.find('div', attrs={'class': 'inline_editor_content'}).text
-            question_link = get_question_link(soup)
-            author = get_author(soup)
-            views = soup.find('div', attrs={'class': 'AnswerHeader ContentHeader'}).text
+            nodes = ANSWER_PLAN.select(soup)
+            answer = nodes['answer'].text
+            question_link = get_question_link(nodes['question_link'])
+            author = get_author(nodes['author'])
+            views = nodes['views'].text
             try:
-                want_answers = soup.find('span', attrs={'class': 'count'}).string
+                want_answers = nodes['want_answers'].string
             except:
                 want_answers = 0
             try:
-                upvote_count = soup.find('a', attrs={'class': 'AnswerUpvotesStatsRow StatsRow'}).text
+                upvote_count = nodes['upvote_count'].text
                 if upvote_count is None:
                     upvote_count = 0
             except:
                 upvote_count = 0
 
             try:
-                comment_count = soup.find('a', attrs={'class': 'view_comments'})
+                comment_count = nodes['comment_count']
                 # print 'comment_count:', comment_count
                 # Only the comments directly on the answer are considered. Comments on comments are ignored.
             except Exception as e:
@@ -184,10 +197,9 @@ class Quora:
         """ (str) -> list
         Takes the title of one question and returns the latest answers to that question.
         """
-        soup = BeautifulSoup(requests.get('https://www.quora.com/' + question + '/log').text)
-
-        # Again: Ugly but need to extract author from possible profile/<author>
-        authors = [author.split('/')[-1] for author in Quora.scrape_latest_answers(soup)]
+        with parsed_page(get_session().get('https://www.quora.com/' + question + '/log').text) as soup:
+            # Again: Ugly but need to extract author from possible profile/<author>
+            authors = [author.split('/')[-1] for author in Quora.scrape_latest_answers(soup)]
         return [Quora.get_one_answer(question, author) for author in authors]
 
     @staticmethod
@@ -198,7 +210,7 @@ class Quora:
         try:
             authors = []
             clean_logs = []
-            raw_logs = soup.find_all('div', attrs={'class': 'feed_item_activity'})
+            raw_logs = LATEST_ANSWERS_PLAN.select(soup)['logs']
 
             for entry in raw_logs:
                 if 'Answer added by' in entry.next:
@@ -218,8 +230,8 @@ class Quora:
         """ (soup) -> dict
         Returns details about the question.
         """
-        soup = BeautifulSoup(requests.get('https://www.quora.com/' + question).text)
-        return Quora.scrape_question_stats(soup)
+        with parsed_page(get_session().get('https://www.quora.com/' + question).text) as soup:
+            return Quora.scrape_question_stats(soup)
 
     @staticmethod
     def scrape_question_stats(soup):
@@ -228,31 +240,36 @@ class Quora:
         """
 
         try:
-            raw_topics = soup.find('div', attrs={'class': 'question_page_topic_section QuestionTopicsSidebar'}
-                                   ).find_all('span', attrs={'class': 'TopicNameSpan TopicName'})
+            nodes = QUESTION_PLAN.select(soup)
+            raw_topics = nodes['topics']
+            if raw_topics is None:
+                raise ValueError('Question topics not found')
             topics = []
             for topic in raw_topics:
-                topics.append(topic.string)
+                name = topic.string
+                topics.append(unicode(name) if name is not None else None)
 
             # want_answers = soup.find('span', attrs={'class' : 'count'}).string
             want_answers = 0
             try:
-                answer_count = soup.find('div', attrs={'class': 'answer_count'}).next.split()[0]
+                answer_count = nodes['answer_count'].next.split()[0]
             except:
                 answer_count = 0
-            question_text = soup.find('div', attrs={'class': 'QuestionArea'}).find('h1').contents[1].text
-            question_details = soup.find('div', attrs={'class': 'question_details_text'})
-            answer_wiki = soup.find('div', attrs={'class': 'AnswerWikiArea'}).find('div')
+            question_text = nodes['question_title'].contents[1].text
+            question_details = nodes['question_details']
+            if nodes['answer_wiki_area'] is None:
+                raise ValueError('Answer wiki not found')
+            answer_wiki = nodes['answer_wiki']
             # related_questions = [str(question.contents[1]) for question in
             #                      soup.find_all('span', attrs={'class': 'question_text'})]
             related_questions = []
-            for question in soup.find_all('span', attrs={'class': 'question_text'}):
+            for question in nodes['related_questions']:
                 try:
                     question_text = str(question.contents[1])
                     related_questions.append(question_text)
                 except:
                     print 'Skipping question: ', question.contents[0]
-            last_asked = soup.find('div', attrs={'class': 'QuestionLastAskedTime'}).text
+            last_asked = nodes['last_asked'].text
 
             question_dict = {'want_answers': try_cast_int(want_answers),
                              'answer_count': try_cast_int(answer_count),
@@ -278,13 +295,12 @@ class Quora:
         """
         url = 'https://www.quora.com/search?q=%s' % query
 
-        soup = BeautifulSoup(get_with_agent(url).text)
-
-        # Getting text snippets from 'search_result_snippet' span
-        search_result_snippets = [snippet.text for snippet in soup.find_all(
-            'span',
-            attrs={'class': 'search_result_snippet'}
-        )]
+        with parsed_page(get_with_agent(url).text) as soup:
+            # Getting text snippets from 'search_result_snippet' span
+            search_result_snippets = [snippet.text for snippet in soup.find_all(
+                'span',
+                attrs={'class': 'search_result_snippet'}
+            )]
 
         return search_result_snippets
 
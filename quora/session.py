@@ -0,0 +1,323 @@
+#coding=utf-8
+
+from bs4 import BeautifulSoup
+from contextlib import contextmanager
+import atexit
+import gc
+import os
+import requests
+import resource
+import sys
+import threading
+
+from pyvirtualdisplay import Display
+from selenium import webdriver
+
+### Configuration ###
+# 0 - Xvfb (not visible)
+# 1 - Xephyr (visible)
+DISPLAY_VISIBLE = 1
+DISPLAY_SIZE    = (800, 600)
+
+# FIXME: Hardcoded path to Chrome profile config
+CHROME_PROFILE_PATH = '/home/michal3141/.config/google-chrome/Default'
+
+# Recycling thresholds, None disables them.
+DEFAULT_MAX_PAGES = None   # pages served by one browser / HTTP client
+DEFAULT_MAX_RSS   = None   # resident memory in megabytes, see ScrapeSession
+# Pages a browser serves before it may be recycled for memory, so a browser
+# that stays above max_rss after a restart is not relaunched on every page.
+DEFAULT_MIN_PAGES = 20
+
+####################################################################
+# Helpers
+####################################################################
+
+def chrome_options():
+    options = webdriver.ChromeOptions()
+    options.add_argument("user-data-dir=%s" % CHROME_PROFILE_PATH) #Path to your chrome profile
+    return options
+
+def current_rss():
+    """ () -> int
+    Returns the resident memory of this process in bytes.
+    Falls back to the peak resident memory where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except IOError:
+        return peak_rss()
+
+def process_tree_rss(pid):
+    """ (int) -> int
+    Returns the resident memory in bytes of a process and all of its
+    descendants, or None where /proc is not available.
+    """
+    try:
+        pids = [int(entry) for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return None
+    children = {}
+    rss = {}
+    for child in pids:
+        try:
+            with open('/proc/%d/stat' % child) as stat:
+                # Skip past the command name, which may contain spaces.
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except IOError:
+            continue  # Exited in the meantime
+        children.setdefault(int(fields[1]), []).append(child)
+        rss[child] = int(fields[21]) * resource.getpagesize()
+    if pid not in rss:
+        return None
+    total = 0
+    pending = [pid]
+    while pending:
+        pid = pending.pop()
+        total += rss.get(pid, 0)
+        pending.extend(children.get(pid, []))
+    return total
+
+def browser_pid(browser):
+    """ (webdriver) -> int
+    Returns the pid of the chromedriver service behind a browser, or None.
+    """
+    process = getattr(getattr(browser, 'service', None), 'process', None)
+    return getattr(process, 'pid', None)
+
+def peak_rss():
+    """ () -> int
+    Returns the peak resident memory of this process in bytes.
+    """
+    # ru_maxrss is in bytes on OS X and in kilobytes elsewhere.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+@contextmanager
+def parsed_page(markup):
+    """ Parses markup and decomposes the tree once the block is done with it,
+    so nothing that escapes the block keeps the whole page alive. Anything
+    returned from the block must be copied out as plain strings.
+    """
+    soup = BeautifulSoup(markup)
+    try:
+        yield soup
+    finally:
+        # soup.decompose() only clears the root, which is not linked to its elements.
+        soup.clear(decompose=True)
+
+####################################################################
+# API
+####################################################################
+class ScrapeSession:
+    """
+    Owns the virtual display, the selenium browser and the HTTP client used
+    for scraping, starting each one on first use.
+
+    The browser (with its display) and the HTTP client are recycled after
+    max_pages pages each. The browser is also recycled once chromedriver and
+    the Chrome processes below it use more than max_rss megabytes, at most
+    once every min_pages pages. Recycling cannot shrink this Python process,
+    so its memory is only reported: memory_stats()['over_max_rss'] tells a
+    worker when to restart itself.
+    Recycling happens when a resource is next requested. A retired HTTP
+    client is closed only once the requests running on it finish; the
+    browser is shared, so drive it from one thread at a time.
+    Used as a context manager, the session becomes the shared session for
+    the Quora and User classes until the block ends, when it is closed and
+    the previous shared session is restored. Otherwise call close().
+    """
+
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES, max_rss=DEFAULT_MAX_RSS,
+                 min_pages=DEFAULT_MIN_PAGES, visible=DISPLAY_VISIBLE,
+                 size=DISPLAY_SIZE, options=None):
+        self.max_pages = max_pages
+        self.max_rss = max_rss
+        self.min_pages = min_pages
+        self.visible = visible
+        self.size = size
+        self.options = options
+        self.lock = threading.RLock()
+        self._display = None
+        self._browser = None
+        self._http = None
+        # Requests running on each HTTP client; a retired client is closed
+        # once its last request finishes.
+        self._in_flight = {}
+        self._previous = None
+        self.browser_pages = 0
+        self.http_pages = 0
+        self.pages = 0
+        self.recycles = 0
+
+    def __enter__(self):
+        self._previous = swap_session(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self.close()
+        finally:
+            swap_session(self._previous)
+            self._previous = None
+
+    def _due(self, pages):
+        return pages > 0 and self.max_pages is not None and pages >= self.max_pages
+
+    def _browser_due(self):
+        if self._due(self.browser_pages):
+            return True
+        if self.max_rss is None or self.browser_pages == 0 or self.browser_pages < self.min_pages:
+            return False
+        used = self.browser_rss()
+        return used is not None and used > self.max_rss * 1024 * 1024
+
+    def browser_rss(self):
+        """ () -> int
+        Returns the resident memory of the browser's process tree in bytes, or None.
+        """
+        with self.lock:
+            pid = browser_pid(self._browser)
+        return process_tree_rss(pid) if pid is not None else None
+
+    def browser(self):
+        """ () -> webdriver
+        Returns the browser for the next page, relaunching it first if it is due for recycling.
+        Fetch it once per page: the browser may be replaced on the following call.
+        """
+        with self.lock:
+            if self._browser_due():
+                self.recycle_browser()
+            if self._browser is None:
+                if self._display is None:
+                    self._display = Display(visible=self.visible, size=self.size)
+                    self._display.start()
+                self._browser = webdriver.Chrome(chrome_options=self.options or chrome_options())
+            self.browser_pages += 1
+            self.pages += 1
+            return self._browser
+
+    def get(self, url, **kwargs):
+        """ (str) -> Response
+        Performs a GET request with the session's HTTP client.
+        """
+        with self.lock:
+            if self._due(self.http_pages):
+                self.recycle_http()
+            if self._http is None:
+                self._http = requests.Session()
+            http = self._http
+            self._in_flight[http] = self._in_flight.get(http, 0) + 1
+            self.http_pages += 1
+            self.pages += 1
+        try:
+            return http.get(url, **kwargs)
+        finally:
+            with self.lock:
+                self._in_flight[http] -= 1
+                if self._in_flight[http] == 0:
+                    del self._in_flight[http]
+                    if http is not self._http:
+                        http.close()
+
+    def page_done(self):
+        """ Counts a page fetched outside of the session, e.g. by feedparser. """
+        with self.lock:
+            self.pages += 1
+
+    def recycle_browser(self):
+        """ Quits the browser and stops the display; both restart on next use. """
+        with self.lock:
+            if self._browser is None and self._display is None:
+                return
+            try:
+                if self._browser is not None:
+                    self._browser.quit()
+            finally:
+                self._browser = None
+                try:
+                    if self._display is not None:
+                        self._display.stop()
+                finally:
+                    self._display = None
+                    self.browser_pages = 0
+                    self.recycles += 1
+                    gc.collect()
+
+    def recycle_http(self):
+        """ Retires the HTTP client; a new one starts on next use. The old one
+        and its pooled connections are closed once no request is running on it.
+        """
+        with self.lock:
+            if self._http is None:
+                return
+            try:
+                if self._http not in self._in_flight:
+                    self._http.close()
+            finally:
+                self._http = None
+                self.http_pages = 0
+                self.recycles += 1
+                gc.collect()
+
+    def close(self):
+        with self.lock:
+            self.recycle_browser()
+            self.recycle_http()
+
+    def memory_stats(self):
+        """ () -> dict
+        Returns resident memory in bytes along with page and recycling counters.
+        over_max_rss is True once this process uses more than max_rss megabytes.
+        """
+        with self.lock:
+            rss = current_rss()
+            return {'rss'           : rss,
+                    'over_max_rss'  : self.max_rss is not None and rss > self.max_rss * 1024 * 1024,
+                    'peak_rss'      : peak_rss(),
+                    'browser_rss'   : self.browser_rss(),
+                    'pages'         : self.pages,
+                    'browser_pages' : self.browser_pages,
+                    'http_pages'    : self.http_pages,
+                    'recycles'      : self.recycles,
+                    'browser_open'  : self._browser is not None,
+                    'display_open'  : self._display is not None}
+
+# Session shared by the Quora and User classes
+session = None
+session_lock = threading.Lock()
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            session = ScrapeSession()
+        return session
+
+def swap_session(new_session):
+    """ (ScrapeSession) -> ScrapeSession
+    Installs new_session as the shared session and returns the previous one
+    as is, for callers that restore it later.
+    """
+    global session
+    with session_lock:
+        old_session, session = session, new_session
+        return old_session
+
+def set_session(new_session):
+    """ (ScrapeSession) -> None
+    Replaces the shared session, e.g. to configure recycling thresholds,
+    and closes the previous one.
+    """
+    old_session = swap_session(new_session)
+    if old_session is not None and old_session is not new_session:
+        old_session.close()
+
+def close_session():
+    global session
+    with session_lock:
+        if session is not None:
+            session.close()
+            session = None
+
+atexit.register(close_session)
@@ -1,39 +1,34 @@
 #coding=utf-8
 
-from bs4 import BeautifulSoup
-from quora import try_cast_int
+from extraction import SelectorPlan
+from quora import try_cast_int, get_browser
+from session import get_session, parsed_page
 import feedparser
 import re
-import requests
 import string
+import threading
 import time
 
-from pyvirtualdisplay import Display
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
-
-# 0 - Xvfb (not visible)
-# 1 - Xephyr (visible)
-display = Display(visible=1, size=(800,600))
-display.start()
-
-# FIXME: Hardcoded path to Chrome profile config 
-CHROME_PROFILE_PATH = '/home/michal3141/.config/google-chrome/Default'
-options = webdriver.ChromeOptions() 
-options.add_argument("user-data-dir=%s" % CHROME_PROFILE_PATH) #Path to your chrome profile
-
-# Launching Chrome browser
-browser = None
-def get_browser():
-    global browser
-    if browser is None:
-        browser = webdriver.Chrome(chrome_options=options)
-    return browser
-
 ### Configuration ###
 POSSIBLE_FEED_KEYS = ['link', 'id', 'published', 'title', 'summary']
 
+# Fields available through User.load and the source each one is fetched from.
+PROFILE_FIELDS = ['answers', 'blogs', 'edits', 'followers_count', 'following_count',
+                  'name', 'posts', 'questions', 'topics', 'username']
+USER_FIELDS = PROFILE_FIELDS + ['followers', 'following', 'activity', 'classified_activity']
+USER_FIELD_SOURCES = dict([(field, 'profile') for field in PROFILE_FIELDS] +
+                          [('followers', 'followers'), ('following', 'following'),
+                           ('activity', 'rss'), ('classified_activity', 'rss')])
+# Sources in the same group run one after another on one thread, groups run
+# concurrently. followers and following share the single selenium browser.
+USER_SOURCE_GROUPS = [['profile'], ['rss'], ['followers', 'following']]
+
+### Page layouts ###
+PROFILE_PLAN = SelectorPlan({
+    'name'        : {'tag': 'span', 'class': 'user'},
+    'list_counts' : {'tag': 'span', 'class': 'list_count', 'all': True},
+})
+
 ### Enumerated Types ###
 def enum(*sequential, **named):
     enums = dict(zip(sequential, range(len(sequential))), **named)
@@ -48,8 +43,11 @@ LOG_ENTRY_TYPES     = enum(ANSWER_ADDED=1, ANSWER_DELETED=2, COMMENT=2, EDIT=3,
 # Helpers
 ####################################################################
 
-def get_name(source):
-    return str(source.find('span', attrs={'class' : 'user'}).string)
+def get_name(name):
+    """ (node) -> str
+    Returns the full name of a user, given the 'user' span selected by PROFILE_PLAN.
+    """
+    return str(name.string)
 
 def build_feed_item(item):
     result = {}
@@ -87,7 +85,6 @@ def is_review(link):
         return False
 
 def check_activity_type(entry):
-    description = BeautifulSoup(entry['description'])
     link        = entry['link']
     base_url    = entry['summary_detail']['base']
 
@@ -95,13 +92,23 @@ def check_activity_type(entry):
         return ACTIVITY_ITEM_TYPES.USER_FOLLOW
     elif is_review(link) is True:
         return ACTIVITY_ITEM_TYPES.REVIEW_REQUEST
-    elif is_want_answer(description) is True:
+
+    with parsed_page(entry['description']) as description:
+        want_answer = is_want_answer(description)
+    if want_answer is True:
         return ACTIVITY_ITEM_TYPES.WANT_ANSWER
     elif is_author(link, base_url) is True:
         return ACTIVITY_ITEM_TYPES.ANSWER
     else:
         return ACTIVITY_ITEM_TYPES.UPVOTE
 
+def fetch_feed(user):
+    """ (str) -> FeedParserDict
+    Downloads and parses the RSS feed of a user, counting it in the shared session.
+    """
+    get_session().page_done()
+    return feedparser.parse('http://www.quora.com/' + user + '/rss')
+
 def unscroll_page(browser, sleep_time=0.5):
     # Fetch page
     src_updated = browser.page_source
@@ -112,52 +119,120 @@ def unscroll_page(browser, sleep_time=0.5):
         browser.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         src_updated = browser.page_source
 
+def run_concurrently(tasks):
+    """ (list) -> list
+    Runs every callable in tasks on its own thread and waits for all of them.
+    Returns a (result, exception) pair per task, in the same order.
+    """
+    outcomes = [(None, None)] * len(tasks)
+    def run(i, task):
+        try:
+            outcomes[i] = (task(), None)
+        except Exception as e:
+            outcomes[i] = (None, e)
+    if len(tasks) == 1:
+        run(0, tasks[0])
+        return outcomes
+    threads = [threading.Thread(target=run, args=(i, task)) for i, task in enumerate(tasks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
 ####################################################################
 # API
 ####################################################################
 class User:
     def __init__(self, user):
         self.user = user
-        self._stats = None
-        self._activity = None
+        self._fields = {}
+
+    def load(self, fields=None):
+        """ ([list]) -> dict
+        Returns the requested fields (all of USER_FIELDS by default), fetching
+        only the sources needed for fields that are not cached yet. Sources are
+        fetched concurrently, except followers and following which share the browser.
+        Fields whose source failed are left out and retried on the next call.
+        """
+        if fields is None:
+            fields = USER_FIELDS
+        elif isinstance(fields, basestring):
+            fields = [fields]
+        for field in fields:
+            if field not in USER_FIELD_SOURCES:
+                raise ValueError('Unknown user field: %s' % field)
+
+        sources = set(USER_FIELD_SOURCES[field] for field in fields if field not in self._fields)
+        groups = []
+        for group in USER_SOURCE_GROUPS:
+            group = [source for source in group if source in sources]
+            if group:
+                groups.append(group)
+
+        for result, error in run_concurrently([self._load_sources(group) for group in groups]):
+            loaded, errors = result if error is None else ({}, [error])
+            for error in errors:
+                print str(error)
+            self._fields.update(loaded)
+
+        return dict((field, self._fields[field]) for field in fields if field in self._fields)
+
+    def _load_sources(self, sources):
+        """ (list) -> function
+        Returns a task loading the given sources in turn. The task returns the
+        fields that loaded along with the errors of the sources that failed, so
+        one failing source does not discard the others in its group.
+        """
+        def load():
+            loaded = {}
+            errors = []
+            for source in sources:
+                try:
+                    loaded.update(getattr(User, '_load_' + source)(self.user))
+                except Exception as e:
+                    errors.append(e)
+            return loaded, errors
+        return load
 
     def stats(self, followers=False, following=False):
-        if self._stats is None:
-            self._stats = self.get_user_stats(self.user, followers=followers, following=following)
-        return self._stats
+        fields = list(PROFILE_FIELDS)
+        if followers:
+            fields.append('followers')
+        if following:
+            fields.append('following')
+        stats = self.load(fields)
+        if 'name' not in stats:
+            return {}
+        return stats
 
     @property
     def activity(self):
-        if self._activity is None:
-            self._activity = self.get_user_activity(self.user)
-        return self._activity
+        return self.load(['activity']).get('activity', {})
+
+    @staticmethod
+    def _load_profile(user):
+        with parsed_page(get_session().get('https://www.quora.com/' + user).text) as soup:
+            return User.scrape_user_stats(soup, user)
+
+    @staticmethod
+    def _load_followers(user):
+        return {'followers': User.get_user_followers(user)}
+
+    @staticmethod
+    def _load_following(user):
+        return {'following': User.get_user_following(user)}
+
+    @staticmethod
+    def _load_rss(user):
+        f = fetch_feed(user)
+        return {'activity': User.scrape_user_activity(f, user),
+                'classified_activity': User.scrape_activity(f)}
 
     @staticmethod
     def get_user_stats(user, followers=False, following=False):
         try:
-            soup = BeautifulSoup(requests.get('https://www.quora.com/' + user).text)
-            data_stats = []
-            name = get_name(soup)
-            err = None
-
-            for item in soup.find_all('span', attrs={'class' : 'list_count'}):
-                data_stats.append(item.string)
-            data_stats = map(try_cast_int, data_stats)
-
-            followers_count = data_stats[3]
-            following_count = data_stats[4]
-
-            user_dict = {'answers'   : data_stats[1],
-                         'blogs'     : err,
-                         'edits'     : data_stats[5],
-                         'followers_count' : followers_count,
-                         'following_count' : following_count,
-                         'name'      : name,
-                         'posts'     : data_stats[2],
-                         'questions' : data_stats[0],
-                         'topics'    : err,
-                         'username'  : user }
-
+            user_dict = User._load_profile(user)
             if followers:
                 user_dict['followers'] = User.get_user_followers(user)
             if following:
@@ -167,64 +242,100 @@ class User:
             print str(e)
             return {}
 
+    @staticmethod
+    def scrape_user_stats(soup, user):
+        nodes = PROFILE_PLAN.select(soup)
+        data_stats = []
+        name = get_name(nodes['name'])
+        err = None
+
+        for item in nodes['list_counts']:
+            data_stats.append(item.string)
+        data_stats = map(try_cast_int, data_stats)
+
+        followers_count = data_stats[3]
+        following_count = data_stats[4]
+
+        user_dict = {'answers'   : data_stats[1],
+                     'blogs'     : err,
+                     'edits'     : data_stats[5],
+                     'followers_count' : followers_count,
+                     'following_count' : following_count,
+                     'name'      : name,
+                     'posts'     : data_stats[2],
+                     'questions' : data_stats[0],
+                     'topics'    : err,
+                     'username'  : user }
+        return user_dict
+
     @staticmethod
     def get_user_followers(user):
-        get_browser().get('https://www.quora.com/%s/followers' % user)
+        browser = get_browser()
+        browser.get('https://www.quora.com/%s/followers' % user)
 
-        unscroll_page(get_browser())
+        unscroll_page(browser)
 
-        followers_elems = get_browser().find_elements_by_css_selector('a.user')
+        followers_elems = browser.find_elements_by_css_selector('a.user')
         followers = [follower.text for follower in followers_elems]
         return followers
 
     @staticmethod
     def get_user_following(user):
-        get_browser().get('https://www.quora.com/%s/following' % user)
+        browser = get_browser()
+        browser.get('https://www.quora.com/%s/following' % user)
 
-        unscroll_page(get_browser())
+        unscroll_page(browser)
 
-        following_elems = get_browser().find_elements_by_css_selector('a.user')
+        following_elems = browser.find_elements_by_css_selector('a.user')
         followings = [following.text for following in following_elems]
         return followings       
 
     @staticmethod
     def get_user_activity(user):
         try:
-            f = feedparser.parse('http://www.quora.com/' + user + '/rss')
-            result = {
-                'username': user,
-                'last_updated': f.feed.updated
-            }
-            for entry in f.entries:
-                if 'activity' not in result.keys():
-                    result['activity'] = []
-                result['activity'].append(build_feed_item(entry))
-            return result
+            f = fetch_feed(user)
+            return User.scrape_user_activity(f, user)
         except:
             return {}
 
+    @staticmethod
+    def scrape_user_activity(f, user):
+        result = {
+            'username': user,
+            'last_updated': f.feed.updated
+        }
+        for entry in f.entries:
+            if 'activity' not in result.keys():
+                result['activity'] = []
+            result['activity'].append(build_feed_item(entry))
+        return result
+
     @staticmethod
     def get_activity(user):
         try:
-            f = feedparser.parse('http://www.quora.com/' + user + '/rss')
-            activity = Activity()
-            for entry in f.entries:
-                activity_type = check_activity_type(entry)
-                if activity_type is not None:
-                    if activity_type == ACTIVITY_ITEM_TYPES.UPVOTE:
-                        activity.upvotes.append(build_feed_item(entry))
-                    elif activity_type == ACTIVITY_ITEM_TYPES.USER_FOLLOW:
-                        activity.user_follows.append(build_feed_item(entry))
-                    elif activity_type == ACTIVITY_ITEM_TYPES.WANT_ANSWER:
-                        activity.want_answers.append(build_feed_item(entry))
-                    elif activity_type == ACTIVITY_ITEM_TYPES.ANSWER:
-                        activity.answers.append(build_feed_item(entry))
-                    elif activity_type == ACTIVITY_ITEM_TYPES.REVIEW_REQUEST:
-                        activity.review_requests.append(build_feed_item(entry))
-            return activity
+            f = fetch_feed(user)
+            return User.scrape_activity(f)
         except:
             return Activity()
 
+    @staticmethod
+    def scrape_activity(f):
+        activity = Activity()
+        for entry in f.entries:
+            activity_type = check_activity_type(entry)
+            if activity_type is not None:
+                if activity_type == ACTIVITY_ITEM_TYPES.UPVOTE:
+                    activity.upvotes.append(build_feed_item(entry))
+                elif activity_type == ACTIVITY_ITEM_TYPES.USER_FOLLOW:
+                    activity.user_follows.append(build_feed_item(entry))
+                elif activity_type == ACTIVITY_ITEM_TYPES.WANT_ANSWER:
+                    activity.want_answers.append(build_feed_item(entry))
+                elif activity_type == ACTIVITY_ITEM_TYPES.ANSWER:
+                    activity.answers.append(build_feed_item(entry))
+                elif activity_type == ACTIVITY_ITEM_TYPES.REVIEW_REQUEST:
+                    activity.review_requests.append(build_feed_item(entry))
+        return activity
+
 class Activity:
     def __init__(self, args=None):
         self.upvotes = []
@@ -0,0 +1,313 @@
+#coding=utf-8
+
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+### Configuration ###
+JOB_KINDS = ['question', 'answer', 'user', 'followers', 'following', 'activity']
+
+JOB_STATES = ['pending', 'leased', 'done', 'failed']
+
+DEFAULT_LEASE_TIME   = 300   # seconds a claimed job stays owned without a heartbeat
+DEFAULT_MAX_ATTEMPTS = 3     # claims per job before it is marked as failed
+DEFAULT_IDLE_SLEEP   = 5     # seconds a worker waits when the queue has nothing to claim
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind          TEXT NOT NULL,
+    args          TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result        TEXT,
+    error         TEXT,
+    created       REAL NOT NULL,
+    updated       REAL NOT NULL,
+    UNIQUE (kind, args)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+"""
+
+####################################################################
+# Helpers
+####################################################################
+
+def default_owner():
+    """ () -> str
+    Identifies the current worker process as <host>:<pid>.
+    """
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+def raise_on_empty(scrape):
+    """ (function) -> function
+    Wraps a scraper that reports failure by returning {}, so that the
+    failure raises instead and the job is retried rather than completed.
+    """
+    def run(*args):
+        result = scrape(*args)
+        if result == {}:
+            raise ValueError('%s returned no data' % scrape.__name__)
+        return result
+    return run
+
+def default_handlers():
+    """ () -> dict
+    Maps every job kind to the scraping function that performs it.
+    """
+    from quora import Quora
+    from user import User
+    return {'question'  : raise_on_empty(Quora.get_question_stats),
+            'answer'    : raise_on_empty(Quora.get_one_answer),
+            'user'      : raise_on_empty(User.get_user_stats),
+            'followers' : User.get_user_followers,
+            'following' : User.get_user_following,
+            'activity'  : raise_on_empty(User.get_user_activity)}
+
+def build_job(row):
+    job = dict(zip(row.keys(), row))
+    job['args'] = json.loads(job['args'])
+    if job['result'] is not None:
+        job['result'] = json.loads(job['result'])
+    return job
+
+####################################################################
+# API
+####################################################################
+class WorkQueue:
+    """
+    Durable queue of scrape jobs stored in a single SQLite file.
+
+    Any number of processes, on this host or on others sharing the file
+    system, may open the same path. A job is claimed with a lease that
+    expires unless the owner heartbeats; expired leases are handed out
+    again until the job runs out of attempts. Completed jobs are never
+    claimed twice.
+    Note: SQLite relies on file locking, so the shared file system must
+    implement it correctly (local disks do, some NFS setups do not).
+    """
+
+    def __init__(self, path, lease_time=DEFAULT_LEASE_TIME,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=60):
+        self.path = path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        # Autocommit mode, transactions are opened explicitly below.
+        self.db = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _transaction(self, statements):
+        """ (list) -> list
+        Runs (sql, params) pairs atomically, taking the write lock up front
+        so concurrent claimers never pick the same row.
+        """
+        with self.lock:
+            cursor = self.db.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                results = []
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+                    results.append(cursor.rowcount)
+                cursor.execute('COMMIT')
+                return results
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def put(self, kind, *args):
+        """ (str, ...) -> bool
+        Adds a job unless the same kind and arguments are already queued.
+        ('question', 'What-is-python') -> True
+        ('answer', 'What-is-python', 'Christopher-J-Su') -> True
+        """
+        return self.put_many(kind, [args]) == 1
+
+    def put_many(self, kind, args_list):
+        """ (str, list) -> int
+        Adds a job for every argument tuple in args_list, returns how many were new.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError('Unknown job kind: %s' % kind)
+        now = time.time()
+        sql = 'INSERT OR IGNORE INTO jobs (kind, args, created, updated) VALUES (?, ?, ?, ?)'
+        return sum(self._transaction([(sql, (kind, json.dumps(list(args)), now, now))
+                                      for args in args_list]))
+
+    def claim(self, owner=None):
+        """ ([str]) -> dict
+        Leases the oldest available job to owner, returns None if there is none.
+        Jobs whose lease expired after their last attempt are marked as failed.
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        with self.lock:
+            cursor = self.db.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute("UPDATE jobs SET state = 'failed', lease_owner = NULL, updated = ?, "
+                               "error = COALESCE(error, 'lease expired') "
+                               "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                               (now, now, self.max_attempts))
+                cursor.execute("SELECT id FROM jobs WHERE state = 'pending' "
+                               "OR (state = 'leased' AND lease_expires < ?) "
+                               "ORDER BY id LIMIT 1", (now,))
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('COMMIT')
+                    return None
+                cursor.execute("UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                               "attempts = attempts + 1, updated = ? WHERE id = ?",
+                               (owner, now + self.lease_time, now, row['id']))
+                cursor.execute('SELECT * FROM jobs WHERE id = ?', (row['id'],))
+                job = build_job(cursor.fetchone())
+                cursor.execute('COMMIT')
+                return job
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def heartbeat(self, job_id, owner=None):
+        """ (int [, str]) -> bool
+        Extends the lease on a job, returns False if owner no longer holds it.
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        sql = ("UPDATE jobs SET lease_expires = ?, updated = ? "
+               "WHERE id = ? AND state = 'leased' AND lease_owner = ?")
+        return self._transaction([(sql, (now + self.lease_time, now, job_id, owner))])[0] == 1
+
+    def complete(self, job_id, result, owner=None):
+        """ (int, object [, str]) -> bool
+        Stores the result of a leased job. Returns False, discarding the
+        result, if the lease was lost to another worker in the meantime.
+        """
+        owner = owner or default_owner()
+        sql = ("UPDATE jobs SET state = 'done', result = ?, error = NULL, lease_owner = NULL, "
+               "lease_expires = NULL, updated = ? "
+               "WHERE id = ? AND state = 'leased' AND lease_owner = ?")
+        return self._transaction([(sql, (json.dumps(result, default=str), time.time(), job_id, owner))])[0] == 1
+
+    def fail(self, job_id, error, owner=None):
+        """ (int, str [, str]) -> bool
+        Releases a leased job after an error. It is retried later unless it
+        has used up all of its attempts.
+        """
+        owner = owner or default_owner()
+        sql = ("UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+               "error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+               "WHERE id = ? AND state = 'leased' AND lease_owner = ?")
+        return self._transaction([(sql, (self.max_attempts, error, time.time(), job_id, owner))])[0] == 1
+
+    def retry_failed(self, kind=None):
+        """ ([str]) -> int
+        Puts failed jobs back into the queue with a fresh set of attempts.
+        """
+        sql = "UPDATE jobs SET state = 'pending', attempts = 0, updated = ? WHERE state = 'failed'"
+        params = (time.time(),)
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params += (kind,)
+        return self._transaction([(sql, params)])[0]
+
+    def get(self, job_id):
+        """ (int) -> dict
+        Returns a job by id, or None.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return build_job(row) if row is not None else None
+
+    def results(self, kind=None):
+        """ ([str]) -> list
+        Returns all completed jobs, optionally only those of one kind.
+        """
+        sql = "SELECT * FROM jobs WHERE state = 'done'"
+        params = ()
+        if kind is not None:
+            sql += ' AND kind = ?'
+            params = (kind,)
+        with self.lock:
+            rows = self.db.execute(sql + ' ORDER BY id', params).fetchall()
+        return [build_job(row) for row in rows]
+
+    def counts(self):
+        """ () -> dict
+        Returns the number of jobs in each state.
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        counts = dict((state, 0) for state in JOB_STATES)
+        counts.update((row[0], row[1]) for row in rows)
+        return counts
+
+
+class Worker:
+    """
+    Claims jobs from a WorkQueue, runs them and writes the results back.
+    Start one per process; the queue takes care of coordination.
+    """
+
+    def __init__(self, queue, handlers=None, owner=None):
+        self.queue = queue
+        self.handlers = handlers if handlers is not None else default_handlers()
+        self.owner = owner or default_owner()
+
+    def _heartbeat(self, job_id, stop):
+        # Renew at a third of the lease so a single slow write does not lose it.
+        interval = max(self.queue.lease_time / 3.0, 1)
+        while not stop.wait(interval):
+            if not self.queue.heartbeat(job_id, self.owner):
+                return
+
+    def process_one(self):
+        """ () -> bool
+        Claims and runs a single job, returns False if the queue had nothing to claim.
+        """
+        job = self.queue.claim(self.owner)
+        if job is None:
+            return False
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], stop))
+        heartbeat.daemon = True
+        heartbeat.start()
+        try:
+            result = self.handlers[job['kind']](*job['args'])
+        except Exception as e:
+            traceback.print_exc(file=sys.stdout)
+            stop.set()
+            heartbeat.join()
+            self.queue.fail(job['id'], '%s: %s' % (type(e).__name__, e), self.owner)
+            return True
+        stop.set()
+        heartbeat.join()
+        self.queue.complete(job['id'], result, self.owner)
+        return True
+
+    def run(self, max_jobs=None, idle_sleep=DEFAULT_IDLE_SLEEP, exit_when_empty=True):
+        """ ([int, float, bool]) -> int
+        Processes jobs until the queue is drained (or forever if exit_when_empty
+        is False), or until max_jobs have been run. Returns the number of jobs run.
+        """
+        processed = 0
+        while max_jobs is None or processed < max_jobs:
+            if self.process_one():
+                processed += 1
+            elif exit_when_empty:
+                break
+            else:
+                time.sleep(idle_sleep)
+        return processed
@@ -0,0 +1,30 @@
+from bs4 import BeautifulSoup
+from quora.extraction import SelectorPlan
+
+PLAN = SelectorPlan({
+    'section' : {'tag': 'div',  'class': 'question_page_topic_section QuestionTopicsSidebar'},
+    'topics'  : {'tag': 'span', 'class': 'TopicNameSpan TopicName', 'all': True, 'within': 'section'},
+    'wiki'    : {'tag': 'div',  'class': 'AnswerWikiArea'},
+    'wiki_div': {'tag': 'div',  'within': 'wiki'},
+    'related' : {'tag': 'span', 'class': 'question_text', 'all': True},
+    'user'    : {'tag': 'a',    'class': 'user'},
+})
+
+class TestSelectorPlan:
+
+    def test_matches_find(self):
+        for name in ['answer_1', 'question_1', 'question_2']:
+            soup = BeautifulSoup(open('tests/input_files/' + name))
+            nodes = PLAN.select(soup)
+            assert nodes['user'] is soup.find('a', attrs={'class': 'user'})
+            assert nodes['related'] == soup.find_all('span', attrs={'class': 'question_text'})
+            wiki = soup.find('div', attrs={'class': 'AnswerWikiArea'})
+            assert nodes['wiki_div'] is (wiki.find('div') if wiki else None)
+
+    def test_within(self):
+        soup = BeautifulSoup('<span class="TopicName TopicNameSpan">outside</span>'
+                             '<div class="question_page_topic_section QuestionTopicsSidebar">'
+                             '<span class="TopicNameSpan TopicName">a</span>'
+                             '<div><span class="TopicNameSpan TopicName">b</span></div></div>')
+        assert [topic.string for topic in PLAN.select(soup)['topics']] == ['a', 'b']
+        assert PLAN.select(BeautifulSoup('<p></p>'))['topics'] is None
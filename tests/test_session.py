@@ -0,0 +1,172 @@
+import os
+import subprocess
+import sys
+import threading
+
+from quora import session
+from quora.session import ScrapeSession, parsed_page
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+    def get(self, url, **kwargs):
+        return url
+    def close(self):
+        self.closed = True
+
+class BlockingClient(FakeClient):
+    started = threading.Event()
+    release = threading.Event()
+    def get(self, url, **kwargs):
+        if url == 'slow':
+            self.started.set()
+            self.release.wait(5)
+            assert not self.closed
+        return url
+
+class FakeProcess:
+    pid = 4242
+
+class FakeService:
+    process = FakeProcess()
+
+class FakeBrowser:
+    service = FakeService()
+    def __init__(self, *args, **kwargs):
+        self.closed = False
+    def quit(self):
+        self.closed = True
+
+class FakeDisplay:
+    def __init__(self, *args, **kwargs):
+        pass
+    def start(self):
+        pass
+    def stop(self):
+        pass
+
+class TestScrapeSession:
+
+    def setup(self):
+        self.patched = [(session.requests, 'Session', FakeClient),
+                        (session.webdriver, 'Chrome', FakeBrowser),
+                        (session, 'Display', FakeDisplay)]
+        self.originals = [(module, name, getattr(module, name)) for module, name, fake in self.patched]
+        for module, name, fake in self.patched:
+            setattr(module, name, fake)
+        self.process_tree_rss = session.process_tree_rss
+
+    def teardown(self):
+        for module, name, original in self.originals:
+            setattr(module, name, original)
+        session.process_tree_rss = self.process_tree_rss
+
+    def test_recycles_http_client(self):
+        with ScrapeSession(max_pages=2) as scrape_session:
+            for url in ['a', 'b']:
+                assert scrape_session.get(url) == url
+            first_client = scrape_session._http
+            scrape_session.get('c')
+            assert first_client.closed
+            assert scrape_session._http is not first_client
+            stats = scrape_session.memory_stats()
+            assert stats['pages'] == 3 and stats['http_pages'] == 1 and stats['recycles'] == 1
+            assert stats['rss'] > 0
+        assert scrape_session._http is None
+
+    def test_parsed_page_is_decomposed(self):
+        with parsed_page('<div><span class="user">Christopher Su</span></div>') as soup:
+            span = soup.find('span')
+            name = unicode(span.string)
+        assert name == u'Christopher Su' and type(name) is unicode
+        # Every node of the tree is cleared, not just the root
+        assert soup.contents == []
+        assert 'parent' not in span.__dict__
+
+    def test_process_rss_is_reported_not_recycled(self):
+        # This process is always above 1 MB, yet dropping the HTTP client would not shrink it.
+        with ScrapeSession(max_rss=1, min_pages=5) as scrape_session:
+            for url in range(10):
+                scrape_session.get(url)
+            stats = scrape_session.memory_stats()
+            assert stats['recycles'] == 0 and stats['http_pages'] == 10
+            assert stats['over_max_rss']
+        assert not ScrapeSession().memory_stats()['over_max_rss']
+
+    def test_browser_rss_recycling_waits_for_min_pages(self):
+        session.process_tree_rss = lambda pid: 2 * 1024 * 1024
+        with ScrapeSession(max_rss=1, min_pages=5) as scrape_session:
+            for page in range(10):
+                scrape_session.browser()
+            assert scrape_session.memory_stats()['recycles'] == 1
+            assert scrape_session.browser_pages == 5
+
+    def test_browser_rss_counts_browser_processes(self):
+        tree_rss = {4242: 0}
+        session.process_tree_rss = lambda pid: tree_rss[pid]
+        with ScrapeSession(max_rss=1, min_pages=1) as scrape_session:
+            # Our own memory is above max_rss but the browser's is not.
+            first_browser = scrape_session.browser()
+            for i in range(4):
+                assert scrape_session.browser() is first_browser
+            tree_rss[4242] = 2 * 1024 * 1024
+            assert scrape_session.browser() is not first_browser
+            assert first_browser.closed
+            assert scrape_session.memory_stats()['browser_rss'] == 2 * 1024 * 1024
+
+    def test_process_tree_rss(self):
+        if not os.path.isdir('/proc'):
+            return
+        # The child touches a megabyte and only then reports that it is ready,
+        # so its resident memory is non-zero by the time it is measured.
+        child = subprocess.Popen([sys.executable, '-u', '-c',
+                                  "x = 'a' * 10 ** 6; print 'ready'; import sys; sys.stdin.read()"],
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            assert child.stdout.readline().strip() == 'ready'
+            child_rss = session.process_tree_rss(child.pid)
+            assert child_rss >= 10 ** 6
+            assert session.process_tree_rss(os.getpid()) > child_rss
+        finally:
+            child.stdin.close()
+            child.wait()
+
+    def test_client_is_not_closed_during_request(self):
+        session.requests.Session = BlockingClient
+        results = []
+        with ScrapeSession(max_pages=1) as scrape_session:
+            slow = threading.Thread(target=lambda: results.append(scrape_session.get('slow')))
+            slow.start()
+            BlockingClient.started.wait(5)
+            first_client = scrape_session._http
+            # Recycles the client the slow request is still running on
+            assert scrape_session.get('fast') == 'fast'
+            assert scrape_session._http is not first_client
+            assert not first_client.closed
+            BlockingClient.release.set()
+            slow.join()
+            assert results == ['slow']
+            assert first_client.closed
+
+    def test_context_manager_installs_shared_session(self):
+        previous = session.swap_session(None)
+        try:
+            outer = session.get_session()
+            with ScrapeSession() as scrape_session:
+                assert session.get_session() is scrape_session
+                scrape_session.get('a')
+            assert scrape_session._http is None
+            assert session.get_session() is outer
+        finally:
+            session.swap_session(previous)
+
+    def test_set_session_closes_previous(self):
+        previous = session.swap_session(None)
+        try:
+            old = session.get_session()
+            old.browser()
+            session.set_session(ScrapeSession())
+            assert old._browser is None and old._display is None
+            assert session.get_session() is not old
+        finally:
+            session.set_session(previous)
@@ -32,3 +32,47 @@ class TestUserStatistics:
             assert isinstance(stat['questions'], (int, long))
             assert isinstance(stat['name'], str)
             assert isinstance(stat['username'], str)
+
+class TestUserLoad:
+
+    def setup(self):
+        self.fetched = []
+        self.load_profile = User._load_profile
+        self.load_rss = User._load_rss
+        self.load_followers = User._load_followers
+        self.load_following = User._load_following
+        def load_profile(user):
+            self.fetched.append('profile')
+            return {'name': 'Christopher Su', 'answers': 1}
+        def load_rss(user):
+            self.fetched.append('rss')
+            return {'activity': {'username': user}, 'classified_activity': None}
+        User._load_profile = staticmethod(load_profile)
+        User._load_rss = staticmethod(load_rss)
+
+    def teardown(self):
+        User._load_profile = staticmethod(self.load_profile)
+        User._load_rss = staticmethod(self.load_rss)
+        User._load_followers = staticmethod(self.load_followers)
+        User._load_following = staticmethod(self.load_following)
+
+    def test_fetches_only_missing_sources(self):
+        user = User('Christopher-J-Su')
+        assert user.load(['name']) == {'name': 'Christopher Su'}
+        assert user.load(['answers', 'activity', 'classified_activity'])['answers'] == 1
+        assert user.activity == {'username': 'Christopher-J-Su'}
+        assert sorted(self.fetched) == ['profile', 'rss']
+
+    def test_failed_source_keeps_rest_of_group(self):
+        def load_followers(user):
+            self.fetched.append('followers')
+            return {'followers': ['Aaron-Ounn']}
+        def load_following(user):
+            self.fetched.append('following')
+            raise RuntimeError('browser crashed')
+        User._load_followers = staticmethod(load_followers)
+        User._load_following = staticmethod(load_following)
+        user = User('Christopher-J-Su')
+        assert user.load(['followers', 'following']) == {'followers': ['Aaron-Ounn']}
+        assert user.load(['followers', 'following']) == {'followers': ['Aaron-Ounn']}
+        assert self.fetched == ['followers', 'following', 'following']
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+
+from bs4 import BeautifulSoup
+from quora import Quora, WorkQueue, Worker
+from quora.work_queue import default_handlers
+
+class TestWorkQueue:
+
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'jobs.db')
+        self.queue = WorkQueue(self.path, lease_time=60, max_attempts=2)
+
+    def teardown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_put_is_idempotent(self):
+        assert self.queue.put('question', 'What-is-python')
+        assert not self.queue.put('question', 'What-is-python')
+        assert self.queue.put_many('user', [['Christopher-J-Su'], ['Aaron-Ounn']]) == 2
+        assert self.queue.counts()['pending'] == 3
+
+    def test_claim_and_complete(self):
+        self.queue.put('answer', 'What-is-python', 'Christopher-J-Su')
+        other = WorkQueue(self.path)
+        job = self.queue.claim('worker-1')
+        assert job['args'] == ['What-is-python', 'Christopher-J-Su']
+        assert other.claim('worker-2') is None
+        assert not other.complete(job['id'], {}, 'worker-2')
+        assert self.queue.complete(job['id'], {'views': 1}, 'worker-1')
+        assert other.results('answer')[0]['result'] == {'views': 1}
+        other.close()
+
+    def test_expired_lease_is_retried(self):
+        self.queue.put('user', 'Christopher-J-Su')
+        self.queue.lease_time = -1
+        first = self.queue.claim('worker-1')
+        second = self.queue.claim('worker-2')
+        assert first['id'] == second['id']
+        assert second['attempts'] == 2
+        assert not self.queue.heartbeat(first['id'], 'worker-1')
+        # Out of attempts once the second lease expires as well.
+        assert self.queue.claim('worker-3') is None
+        assert self.queue.counts()['failed'] == 1
+
+    def test_worker(self):
+        self.queue.put_many('question', [['a'], ['b']])
+        self.queue.put('user', 'c')
+        def fail(user):
+            raise ValueError(user)
+        worker = Worker(self.queue, handlers={'question': lambda q: q.upper(), 'user': fail})
+        assert worker.run() == 4
+        assert [job['result'] for job in self.queue.results()] == ['A', 'B']
+        assert self.queue.counts()['failed'] == 1
+
+    def test_empty_scrape_is_not_completed(self):
+        get_question_stats = Quora.get_question_stats
+        # A page the scraper cannot parse makes it return {}
+        Quora.get_question_stats = staticmethod(lambda question: Quora.scrape_question_stats(BeautifulSoup('')))
+        try:
+            handlers = default_handlers()
+        finally:
+            Quora.get_question_stats = staticmethod(get_question_stats)
+        self.queue.put('question', 'What-is-python')
+        assert Worker(self.queue, handlers=handlers).run() == 2
+        assert self.queue.results() == []
+        assert self.queue.counts()['failed'] == 1
+        assert self.queue.retry_failed('question') == 1